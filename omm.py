@@ -35,9 +35,14 @@ ly = modeller.topology.getUnitCellDimensions().y
 lz = modeller.topology.getUnitCellDimensions().z
 print('#   box', lx, ly, lz, 'nm')
 
+# Ewald tolerance 5e-4 (OpenMM default) trades electrostatics accuracy for PME speed
+# use the tighter 1e-5 below when accuracy matters more
+#system = forcefield.createSystem(modeller.topology, nonbondedMethod=app.PME,
+#    nonbondedCutoff=12.0*unit.angstrom, constraints=app.HBonds,
+#    ewaldErrorTolerance=1.0e-5)
 system = forcefield.createSystem(modeller.topology, nonbondedMethod=app.PME,
     nonbondedCutoff=12.0*unit.angstrom, constraints=app.HBonds,
-    ewaldErrorTolerance=1.0e-5)
+    ewaldErrorTolerance=5.0e-4)
 
 #print('# Drude Nose-Hoover integrator', temperature)
 #integrator = openmm.DrudeNoseHooverIntegrator(temperature, 5/unit.picosecond,
@@ -52,9 +57,18 @@ print('#   barostat', pressure)
 barostat = openmm.MonteCarloBarostat(pressure, temperature)
 system.addForce(barostat)
 
-platform = openmm.Platform.getPlatformByName('CUDA')
+# use the fastest platform available
+for name in ('CUDA', 'OpenCL', 'CPU'):
+    try:
+        platform = openmm.Platform.getPlatformByName(name)
+        break
+    except Exception:
+        pass
 #platform.setPropertyDefaultValue('Precision', 'mixed')
-properties = {'DeviceIndex': '1', 'Precision': 'mixed'}
+if platform.getName() == 'CPU':
+    properties = {}
+else:
+    properties = {'DeviceIndex': '1', 'Precision': 'mixed'}
 
 sim = app.Simulation(modeller.topology, system, integrator, platform, properties)
 sim.context.setPositions(modeller.positions)
@@ -85,7 +99,7 @@ for prop in platform.getPropertyNames():
 # minimize only when starting from fresh conf, not after equilibration
 print('# minimizing...')
 sim.minimizeEnergy(maxIterations=1000)
-state = sim.context.getState(getEnergy=True,getForces=True,getVelocities=True,getPositions=True)
+state = sim.context.getState(getEnergy=True, getPositions=True)
 print('#   Epot', state.getPotentialEnergy(), 'Ekin', state.getKineticEnergy())
 coords = state.getPositions()
 app.PDBFile.writeFile(sim.topology, coords, open('min.pdb', 'w'))
@@ -94,17 +108,17 @@ sim.reporters = []
 sim.reporters.append(app.StateDataReporter(sys.stdout, 1000, step=True,
     speed=True, temperature=True, separator='\t',
     totalEnergy=True, potentialEnergy=True, density=True))
-sim.reporters.append(app.PDBReporter('traj.pdb', 5000))
-#sim.reporters.append(app.DCDReporter('traj.dcd', 5000))
+#sim.reporters.append(app.PDBReporter('traj.pdb', 5000))
+sim.reporters.append(app.DCDReporter('traj.dcd', 5000))
 sim.reporters.append(app.CheckpointReporter('equil.chk', 100000))
 
 kB = unit.BOLTZMANN_CONSTANT_kB/(unit.joule/unit.kelvin)
 NA = unit.AVOGADRO_CONSTANT_NA*unit.mole
 
-iat = [ i for i, atom in enumerate(modeller.topology.atoms()) if atom.name[0] != 'D' ]
-idr = [ i for i, atom in enumerate(modeller.topology.atoms()) if atom.name[0] == 'D' ]
-nat = len(iat)
+isdr = np.array([ atom.name.startswith('D') for atom in modeller.topology.atoms() ], dtype=bool)
+idr = np.flatnonzero(isdr)
 ndr = len(idr)
+nat = len(isdr) - ndr
 
 nall = modeller.topology.getNumAtoms()
 mall = np.array([ system.getParticleMass(i)/unit.dalton for i in range(nall) ])
@@ -112,20 +126,9 @@ mall = np.array([ system.getParticleMass(i)/unit.dalton for i in range(nall) ])
 ncons = system.getNumConstraints()
 
 # reduced mass of DC-DP pairs
-mu = np.zeros(nall)
-for i in idr:
-    mu[i] = 1.0/(1.0/mall[i-1] + 1.0/mall[i])
-mu = mu.reshape((nall, 1))
-vdr = np.zeros((nall, 3))
-
-# add Drude masses back to cores
-mat = np.copy(mall)
-for i in idr:
-    mat[i-1] += 0.4
-mat = mat.take(iat)
-mat = mat.reshape((nat, 1))
-
-mall = mall.reshape((nall, 1))
+mu = 1.0/(1.0/mall[idr-1] + 1.0/mall[idr])
+# masses of DP
+mdr = mall[idr]
 
 print('#', nat, 'atoms', ndr, 'DP', ncons, 'constraints')
 print('# running...')
@@ -133,18 +136,29 @@ print('# running...')
 dof_all = 3*nall - ncons
 dof_at = 3*nat - ncons
 dof_dr = 3*ndr
+s_all = (1e3/NA)/(dof_all*kB)
+s_at = (1e3/NA)/(dof_at*kB)
+s_dr = (1e3/NA)/(dof_dr*kB) if ndr else np.nan
+
+# temperatures are monitored every nmon batches
+nmon = 10
 for i in range(100):
     sim.step(10000)
-    state = sim.context.getState(getVelocities=True)
-    vel = state.getVelocities(asNumpy=True)/(unit.nanometer/unit.picosecond)
-    Tall = np.sum(mall*vel**2)/(dof_all*kB)*(1e3/NA)*unit.kelvin
-    vat = vel.take(iat, axis=0)
-    Tat = np.sum(mat*vat**2)/(dof_at*kB)*(1e3/NA)*unit.kelvin
-
-    for i in idr:
-        vdr[i] = vel[i] - vel[i-1]
-    Tdr = np.sum(mu*vdr**2)/(dof_dr*kB)*(1e3/NA)*unit.kelvin
-    print('# Tall', Tall, 'Tatoms', Tat, 'Tdrude', Tdr)
+    if (i+1) % nmon == 0:
+        state = sim.context.getState(getVelocities=True)
+        vel = np.asarray(state.getVelocities(asNumpy=True).value_in_unit(unit.nanometer/unit.picosecond))
+        vdp = vel[idr]
+        vdc = vel[idr-1]
+        ekall = np.einsum('i,ij,ij->', mall, vel, vel)
+        Tall = ekall*s_all
+        # atoms: Drude masses added back to cores, moving with the core velocity
+        ekat = ekall - np.einsum('i,ij,ij->', mdr, vdp, vdp) + np.einsum('i,ij,ij->', mdr, vdc, vdc)
+        Tat = ekat*s_at
+
+        vdr = vdp - vdc
+        Tdr = np.einsum('i,ij,ij->', mu, vdr, vdr)*s_dr
+        print('# Tall', Tall*unit.kelvin, 'Tatoms', Tat*unit.kelvin,
+            'Tdrude', Tdr*unit.kelvin)
 
 state = sim.context.getState(getPositions=True, getVelocities=True)
 coords = state.getPositions()
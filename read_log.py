@@ -1,36 +1,68 @@
+import io
+import re
 import numpy as np
 import argparse
 
 def ReadLog (logfile):
 
-    file = open(logfile, 'r')
-    line = file.readline()
-    while line :
-        if 'running' in line:
-            break
-        line = file.readline()   
-    properties = [l for l in file.readline().replace('#','').split('\"') if l.strip()]
-    values = [[]]
-    values[0] = file.readline().split()
-    line = file.readline()
-    while line[0] == '#':
-        tok = line.replace('#','').split()
-        properties.append(tok[0]+' ('+tok[2]+')')
-        values[0].append(tok[1])
-        line = file.readline()
-    
-    properties = [p.replace(' ','-')for p in properties]
-    
-    while (len(line.split()) != 0):
-        tmp_val = [[]]
-        tmp_val[0] = line.split()
-        line = file.readline()
-        while line[0] == '#':
-            tmp_val[0].append(line.replace('#','').split()[1])
-            line = file.readline()
-        values.extend(tmp_val)
-    
-    file.close()
+    with open(logfile, 'r') as file:
+        text = file.read()
+    header = re.search(r'running.*\n(.*)\n', text)
+    if header is None:
+        raise RuntimeError("Expected '# running...' followed by a header line in " + logfile)
+    properties = [l for l in header.group(1).replace('#','').split('\"') if l.strip()]
+
+    # data block ends at the first blank line
+    rest = '\n' + text[header.end():]
+    blank = re.search(r'\n[ \t]*\n', rest)
+    block = rest[1:blank.start()+1] if blank else rest[1:]
+    if not block.endswith('\n'):
+        block += '\n'
+
+    # classify rows by their first character
+    b = np.frombuffer(block.encode(), dtype=np.uint8)
+    first = np.concatenate(([0], np.flatnonzero(b == ord('\n'))[:-1] + 1))
+    isdata = b[first] != ord('#')
+    if not block.strip() or not isdata.any():
+        raise RuntimeError('No data rows found in ' + logfile)
+
+    # comment rows ('# name value unit ...') belong to the data row above them
+    owner = (np.cumsum(isdata) - 1)[~isdata]
+    coms = re.findall(r'\n#([^\n]*)', '\n' + block)[np.count_nonzero(owner < 0):]
+    owner = owner[owner >= 0]
+    comtext = '\n'.join(coms).replace('#',' ')
+    # number of tokens in each comment row, counted on the raw characters
+    # (the leading newline puts a separator before the first token)
+    c = np.frombuffer(('\n' + comtext).encode(), dtype=np.uint8)
+    space = c <= ord(' ')
+    start = np.flatnonzero(space[:-1] & ~space[1:])
+    ntok = np.bincount(np.searchsorted(np.flatnonzero(c == ord('\n')), start, side='right') - 1,
+                       minlength=len(coms))
+    # rows that are not made of complete triples are ignored
+    ok = ntok % 3 == 0
+    if not ok.all():
+        owner = owner[ok]
+        ntok = ntok[ok]
+        comtext = '\n'.join([com for com, k in zip(coms, ok) if k]).replace('#',' ')
+    ntrip = ntok//3
+
+    tok = comtext.split()
+    pname = tok[0::3]
+    index = {name: i for i, name in enumerate(dict.fromkeys(pname))}
+    names = [name+' ('+tok[3*pname.index(name)+2]+')' for name in index]
+    cols = np.fromiter(map(index.__getitem__, pname), dtype=np.intp, count=len(pname))
+    vals = np.array(tok[1::3], dtype=float)
+    rows = np.repeat(owner, ntrip)
+
+    properties = [p.replace(' ','-')for p in properties + names]
+
+    # non-numeric entries (e.g. initial speed '--') become nan
+    values = np.loadtxt(io.StringIO(block.replace('--', 'nan')), comments='#', ndmin=2)
+    if names:
+        # rows without comment values are filled with nan
+        extra = np.full((len(values), len(names)), np.nan)
+        extra[rows, cols] = vals
+        values = np.hstack((values, extra))
     return (properties,values)
   
 def WriteOutput (logfile,properties,values):
@@ -38,20 +70,29 @@ def WriteOutput (logfile,properties,values):
     tok.insert((len(tok)-1),'plot')
     outfile = '.'.join(tok)
     prop = ' '.join(properties)
-    np.savetxt(outfile, values, header = prop, comments='', delimiter=' ',fmt='%s')
+    fmt = ['%d' if p == 'Step' else '%s' for p in properties]
+    np.savetxt(outfile, values, header = prop, comments='', delimiter=' ',fmt=fmt)
 
 def GetAverage(properties,values,cut):
-    values=np.array(values).transpose()
-    frames = int(round((1.0-cut)*len(values[0]),0))
-    print('# Averaged over last {0:d} frames (steps {1} ... {2})'.format(frames,values[properties.index('Step'),(len(values[0])-frames)],values[properties.index('Step'),len(values[0])-1]))
+    nframes = len(values)
+    frames = int(round((1.0-cut)*nframes,0))
+    step = properties.index('Step')
+    print('# Averaged over last {0:d} frames (steps {1:d} ... {2:d})'.format(frames,int(values[nframes-frames,step]),int(values[nframes-1,step])))
 
-    for prop in properties:
+    val = values[(nframes-frames):]
+    # columns from comment rows are only present in some frames
+    nsamp = np.count_nonzero(~np.isnan(val), axis=0)
+    mean = np.full(len(properties), np.nan)
+    std = np.full(len(properties), np.nan)
+    has = nsamp > 0
+    mean[has] = np.nanmean(val[:,has], axis=0)
+    std[has] = np.nanstd(val[:,has], axis=0)
+    for i, prop in enumerate(properties):
         if 'Step' not in prop:
-            i = properties.index(prop)
-            val = values[i]
-            mean = np.mean([float(x) for x in val[(len(val)-frames):]])
-            std = np.std([float(x) for x in val[(len(val)-frames):]]) 
-            print('{0:30s} {1:15.5f} +/- {2:.5f}'.format(prop.replace('-',' '),mean,std))
+            if nsamp[i] == 0:
+                print('{0:30s} {1:>15s}'.format(prop.replace('-',' '),'no samples'))
+            else:
+                print('{0:30s} {1:15.5f} +/- {2:.5f}'.format(prop.replace('-',' '),mean[i],std[i]))
 
 def main():
     parser = argparse.ArgumentParser( description = 'Reads log file, print file for plotting and calculates average values')